@@ -1,40 +1,42 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
-from sklearn.metrics import classification_report, accuracy_score
-
-# Load the dataset
-df = pd.read_csv("outbreaks.csv")
-df.head()
-
-"""### Data Cleaning & Preprocessing"""
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.inspection import permutation_importance
+from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
+import joblib
 
-# Check missing values
-missing_values = df.isnull().sum()
+"""### Data Loading, Cleaning & Preprocessing"""
 
-# Fill missing values
-df_cleaned = df.copy()
+# Load and clean the dataset (cached across Streamlit reruns, string columns cast to category)
+@st.cache_data
+def load_data():
+    df_cleaned = pd.read_csv("outbreaks.csv", engine="pyarrow").astype(
+        {'State': 'category', 'Month': 'category', 'Location': 'category',
+         'Food': 'category', 'Ingredient': 'category', 'Species': 'category',
+         'Serotype/Genotype': 'category', 'Status': 'category'})
 
-# Fill missing categorical columns with "Unknown"
-categorical_cols = ['Location', 'Food', 'Ingredient', 'Species', 'Serotype/Genotype', 'Status']
-df_cleaned[categorical_cols] = df_cleaned[categorical_cols].fillna('Unknown')
+    # Fill missing categorical columns with "Unknown"
+    categorical_cols = ['Location', 'Food', 'Ingredient', 'Species', 'Serotype/Genotype', 'Status']
+    for col in categorical_cols:
+        if 'Unknown' not in df_cleaned[col].cat.categories:
+            df_cleaned[col] = df_cleaned[col].cat.add_categories('Unknown')
+        df_cleaned[col] = df_cleaned[col].fillna('Unknown')
 
-# Fill numeric columns with 0
-df_cleaned[['Hospitalizations', 'Fatalities']] = df_cleaned[['Hospitalizations', 'Fatalities']].fillna(0)
+    # Fill numeric columns with 0
+    df_cleaned[['Hospitalizations', 'Fatalities']] = df_cleaned[['Hospitalizations', 'Fatalities']].fillna(0)
 
-# Convert categorical columns to category dtype
-for col in categorical_cols + ['State', 'Month']:
-    df_cleaned[col] = df_cleaned[col].astype('category')
+    # Create a binary target variable: Was anyone hospitalized?
+    df_cleaned['Hospitalized'] = (df_cleaned['Hospitalizations'].to_numpy() > 0).astype(np.int8)
 
-# Create a binary target variable: Was anyone hospitalized?
-df_cleaned['Hospitalized'] = df_cleaned['Hospitalizations'].apply(lambda x: 1 if x > 0 else 0)
+    return df_cleaned
 
 # Preview cleaned data
+df_cleaned = load_data()
 df_cleaned.head()
 
 """### EDA"""
@@ -42,66 +44,98 @@ df_cleaned.head()
 sns.set(style="whitegrid")
 plt.rcParams["figure.figsize"] = (10, 6)
 
-# 1. Trend of total illnesses and hospitalizations per year
-illness_trend = df_cleaned.groupby('Year')[['Illnesses', 'Hospitalizations']].sum().reset_index()
+# EDA aggregations (cached across Streamlit reruns; reads the cached frame
+# itself so reruns do not hash df_cleaned)
+@st.cache_data
+def eda_summaries():
+    df_cleaned = load_data()
 
-# 2. Top 10 food items associated with hospitalization
-top_foods = df_cleaned[df_cleaned['Hospitalized'] == 1]['Food'].value_counts().head(10)
-st.dataframe(top_foods)
+    # 1. Trend of total illnesses and hospitalizations per year
+    illness_trend = df_cleaned.groupby('Year')[['Illnesses', 'Hospitalizations']].sum().reset_index()
 
-# 3. Top 10 locations where hospitalizations occurred
-top_locations = df_cleaned[df_cleaned['Hospitalized'] == 1]['Location'].value_counts().head(10)
+    # Outbreaks with at least one hospitalization (filtered once, reused below)
+    hosp = df_cleaned[df_cleaned['Hospitalized'] == 1]
 
-# 4. Top 10 affected states (by illness count)
-top_states = df_cleaned.groupby('State')['Illnesses'].sum().sort_values(ascending=False).head(10)
+    # 2. Top 10 food items associated with hospitalization
+    top_foods = hosp['Food'].value_counts().head(10)
+
+    # 3. Top 10 locations where hospitalizations occurred
+    top_locations = hosp['Location'].value_counts().head(10)
+
+    # 4. Top 10 affected states (by illness count)
+    top_states = df_cleaned.groupby('State', observed=True, sort=False)['Illnesses'].sum().nlargest(10)
+
+    return illness_trend, top_foods, top_locations, top_states
+
+illness_trend, top_foods, top_locations, top_states = eda_summaries()
+st.dataframe(top_foods)
 top_states
 
-# Trend over years
-plt.figure(figsize=(12, 6))
+# Charts are only drawn when requested
+if st.checkbox("Show EDA charts"):
+    # Trend over years
+    fig, ax = plt.subplots(figsize=(12, 6))
 
-sns.lineplot(data=illness_trend, x='Year', y='Illnesses', label='Illnesses')
-sns.lineplot(data=illness_trend, x='Year', y='Hospitalizations', label='Hospitalizations')
-plt.title("Yearly Trend of Illnesses and Hospitalizations")
-plt.legend()
+    sns.lineplot(data=illness_trend, x='Year', y='Illnesses', label='Illnesses', ax=ax)
+    sns.lineplot(data=illness_trend, x='Year', y='Hospitalizations', label='Hospitalizations', ax=ax)
+    ax.set_title("Yearly Trend of Illnesses and Hospitalizations")
+    ax.legend()
 
-plt.tight_layout()
-plt.show()
+    fig.tight_layout()
+    st.pyplot(fig)
+    plt.close(fig)
 
-# Top affected states
-plt.figure(figsize=(12,6))
+    # Top affected states
+    fig, ax = plt.subplots(figsize=(12, 6))
 
-sns.barplot(x=top_states.values, y=top_states.index)
-plt.title("Top 10 States by Illness Count")
-plt.xlabel("Number of Illnesses")
+    sns.barplot(x=top_states.values, y=top_states.index, ax=ax)
+    ax.set_title("Top 10 States by Illness Count")
+    ax.set_xlabel("Number of Illnesses")
 
-plt.tight_layout()
-plt.show()
+    fig.tight_layout()
+    st.pyplot(fig)
+    plt.close(fig)
 
 """### Model Training"""
 
-# Copy cleaned dataset
-df_model = df_cleaned.copy()
-
 # Select features and target
 features = ['Year', 'Month', 'State', 'Location', 'Food']
 target = 'Hospitalized'
 
-# Encode categorical features
-le_dict = {}
-for col in features:
-    if df_model[col].dtype.name == 'category':
-        le = LabelEncoder()
-        df_model[col] = le.fit_transform(df_model[col])
-        le_dict[col] = le
-
-# Split data
-X = df_model[features]
-y = df_model[target]
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+@st.cache_data
+def prepare_data():
+    # Copy only the modeling columns of the cleaned dataset
+    df_model = load_data()[features + [target]].copy()
+
+    # Encode categorical features (category codes; keep categories for decoding)
+    cat_dict = {col: df_model[col].cat.categories for col in features
+                if df_model[col].dtype.name == 'category'}
+    df_model[features] = df_model[features].apply(lambda s: s.cat.codes if s.dtype.name == 'category' else s)
+
+    # Split data (shared by the Random Forest and the deep learning model)
+    X_codes = df_model[features]
+    y = df_model[target]
+    X_train, X_test, y_train, y_test = train_test_split(X_codes.to_numpy(dtype=np.float32), y.to_numpy(),
+                                                        test_size=0.3, random_state=42)
+    return X_train, X_test, y_train, y_test, cat_dict
+
+X_train, X_test, y_train, y_test, cat_dict = prepare_data()
+
+# Trained models are cached per training data, so widget reruns do not retrain them
+@st.cache_resource
+def train_gradient_boosting(X_train, y_train):
+    # Month, State and Location split natively as categoricals;
+    # Food has more levels than max_bins, so it is binned as ordinal codes
+    model = HistGradientBoostingClassifier(max_iter=200, max_bins=255, categorical_features=[1, 2, 3],
+                                           early_stopping=True, random_state=42)
+    model.fit(X_train, y_train)
+
+    # Save the model
+    joblib.dump(model, 'model.pkl', compress=('lz4', 3))
+    return model
 
 # Train model
-model = RandomForestClassifier(n_estimators=100, random_state=42)
-model.fit(X_train, y_train)
+model = train_gradient_boosting(X_train, y_train)
 
 # Predict and evaluate
 y_pred = model.predict(X_test)
@@ -110,74 +144,109 @@ print("\nClassification Report:\n", classification_report(y_test, y_pred))
 
 """### Check feature importance"""
 
-# Plot feature importance
-feat_importances = pd.Series(model.feature_importances_, index=features)
-feat_importances.sort_values().plot(kind='barh')
-plt.title("Feature Importance - Random Forest")
-plt.xlabel("Importance Score")
-plt.show()
+# Permutation importance on the test split
+@st.cache_data
+def feature_importance(X_train, y_train, X_test, y_test):
+    model = train_gradient_boosting(X_train, y_train)
+    perm = permutation_importance(model, X_test, y_test, n_repeats=5, random_state=42, n_jobs=-1)
+    return pd.Series(perm.importances_mean, index=features)
 
-"""### Save the model"""
-
-import pickle
-pickle.dump(model, open('model.pkl', 'wb'))
+# Plot feature importance
+if st.checkbox("Show feature importance"):
+    feat_importances = feature_importance(X_train, y_train, X_test, y_test)
+    fig, ax = plt.subplots()
+    feat_importances.sort_values().plot(kind='barh', ax=ax)
+    ax.set_title("Feature Importance - Gradient Boosting")
+    ax.set_xlabel("Importance Score")
+    st.pyplot(fig)
+    plt.close(fig)
 
 """### Deep Learning"""
 
+import os
+os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '1')  # oneDNN CPU kernels for Dense/ReLU
+
 import tensorflow as tf
+from tensorflow.keras import mixed_precision
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense, Dropout
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder, StandardScaler
-from sklearn.metrics import classification_report, accuracy_score
-
-# Encode categorical features
-df_dl = df_cleaned.copy()
-features = ['Year', 'Month', 'State', 'Location', 'Food']
-target = 'Hospitalized'
 
-le_dict = {}
-for col in features:
-    if df_dl[col].dtype.name == 'category':
-        le = LabelEncoder()
-        df_dl[col] = le.fit_transform(df_dl[col])
-        le_dict[col] = le
-
-# Prepare input/output
-X = df_dl[features]
-y = df_dl[target]
-
-# Normalize input features
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
-
-# Train-test split
-X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, test_size=0.3, random_state=42)
-
-# Build model
-model = Sequential([
-    Dense(64, activation='relu', input_shape=(X_train.shape[1],)),
-    Dropout(0.3),
-    Dense(32, activation='relu'),
-    Dropout(0.2),
-    Dense(1, activation='sigmoid')
-])
-
-# Compile model
-model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
-
-# Train model
-history = model.fit(X_train, y_train, epochs=50, batch_size=32, validation_split=0.2, verbose=0)
-
-# Evaluate
-y_pred = (model.predict(X_test) > 0.5).astype("int32")
-print("Accuracy:", accuracy_score(y_test, y_pred))
-print("\nClassification Report:\n", classification_report(y_test, y_pred))
+# Normalize input features in float32 (statistics from the training split only)
+mu = X_train.mean(0, dtype=np.float32)
+sd = X_train.std(0, dtype=np.float32) + 1e-7
+X_train_s = (X_train - mu) / sd
+X_test_s = (X_test - mu) / sd
+
+@st.cache_resource
+def train_mlp(X_train_s, y_train):
+    # Mixed precision (float16 compute, float32 variables) only pays off on GPUs
+    if tf.config.list_physical_devices('GPU'):
+        mixed_precision.set_global_policy('mixed_float16')
+
+    # Build model
+    model = Sequential([
+        Dense(64, activation='relu', input_shape=(X_train_s.shape[1],)),
+        Dropout(0.3),
+        Dense(32, activation='relu'),
+        Dropout(0.2),
+        Dense(1, activation='sigmoid', dtype='float32')  # keep the output in float32 for a stable loss
+    ])
+
+    # Compile model (XLA fuses the Dense, ReLU and Dropout ops)
+    model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'], jit_compile=True)
+
+    # Input pipelines (last 20% of the training split held out for validation)
+    n_val = int(len(X_train_s) * 0.2)
+    train_ds = (tf.data.Dataset.from_tensor_slices((X_train_s[:-n_val],
+                                                    y_train[:-n_val].astype(np.float32)))
+                .cache().shuffle(8192).batch(512).prefetch(tf.data.AUTOTUNE))
+    val_ds = (tf.data.Dataset.from_tensor_slices((X_train_s[-n_val:],
+                                                  y_train[-n_val:].astype(np.float32)))
+              .batch(512).cache().prefetch(tf.data.AUTOTUNE))
+
+    # Train model
+    history = model.fit(train_ds, epochs=50, validation_data=val_ds, verbose=0)
+
+    # Save the model
+    model.save('model.keras')
+    return model, history
+
+model, history = train_mlp(X_train_s, y_train)
+
+"""### Export to ONNX"""
+
+import tf2onnx
+import onnxruntime as ort
+
+@st.cache_resource
+def export_onnx(X_train_s, y_train):
+    model, _ = train_mlp(X_train_s, y_train)
+
+    # Export a float32 copy of the model, since ONNX Runtime runs it on CPU
+    mixed_precision.set_global_policy('float32')
+    export_model = tf.keras.models.clone_model(
+        model, clone_function=lambda layer: layer.__class__.from_config({**layer.get_config(), 'dtype': 'float32'}))
+    export_model.set_weights(model.get_weights())
+
+    spec = (tf.TensorSpec((None, X_train_s.shape[1]), tf.float32),)
+    # from_function rather than from_keras, which fails on Keras 3 models
+    tf2onnx.convert.from_function(tf.function(lambda t: export_model(t, training=False)),
+                                  input_signature=spec, output_path='model.onnx')
+
+    return ort.InferenceSession('model.onnx', providers=['CPUExecutionProvider'])
+
+sess = export_onnx(X_train_s, y_train)
+onnx_input = sess.get_inputs()[0].name
+
+# Predict (single inference pass over the test split, evaluated in the Prediction section)
+y_pred_prob = sess.run(None, {onnx_input: X_test_s})[0]
+y_pred = (y_pred_prob > 0.5).astype(np.int8).ravel()
 
 """### Hyperparamater Tunning"""
 
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import RandomizedSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingRandomSearchCV
 
 # Define parameter grid
 param_grid = {
@@ -188,14 +257,22 @@ param_grid = {
     'bootstrap': [True, False]
 }
 
-# Instantiate model
-rf = RandomForestClassifier(random_state=42)
+@st.cache_resource
+def tune_random_forest(X_train, y_train):
+    # Instantiate model (n_jobs=-1 parallelizes the final refit and predictions)
+    rf = RandomForestClassifier(n_jobs=-1, random_state=42)
 
-# Randomized Search
-rf_random = RandomizedSearchCV(estimator=rf, param_distributions=param_grid,
-                               n_iter=20, cv=3, verbose=2, n_jobs=-1, random_state=42)
+    # Randomized Search with successive halving (candidates start on a small
+    # sample and only the best are retrained on more rows)
+    rf_random = HalvingRandomSearchCV(estimator=rf, param_distributions=param_grid, n_candidates=20,
+                                      factor=3, resource='n_samples', min_resources='exhaust',
+                                      max_resources=len(X_train), cv=3, verbose=2, n_jobs=-1,
+                                      random_state=42)
 
-rf_random.fit(X_train, y_train)
+    rf_random.fit(X_train, y_train)
+    return rf_random
+
+rf_random = tune_random_forest(X_train, y_train)
 
 # Best model evaluation
 best_model = rf_random.best_estimator_
@@ -206,68 +283,64 @@ print("\nTuned Classification Report:\n", classification_report(y_test, y_pred_t
 
 """### Visualize Training Loss and Accuracy Curves"""
 
-# Plot Accuracy
-plt.figure(figsize=(12, 5))
-plt.subplot(1, 2, 1)
-plt.plot(history.history['accuracy'], label='Train Accuracy', marker='o')
-plt.plot(history.history['val_accuracy'], label='Validation Accuracy', marker='o')
-plt.title('Model Accuracy Over Epochs')
-plt.xlabel('Epoch')
-plt.ylabel('Accuracy')
-plt.legend()
-
-# Plot Loss
-plt.subplot(1, 2, 2)
-plt.plot(history.history['loss'], label='Train Loss', marker='o')
-plt.plot(history.history['val_loss'], label='Validation Loss', marker='o')
-plt.title('Model Loss Over Epochs')
-plt.xlabel('Epoch')
-plt.ylabel('Loss')
-plt.legend()
-
-plt.tight_layout()
-plt.show()
+if st.checkbox("Show training curves"):
+    fig, (ax_acc, ax_loss) = plt.subplots(1, 2, figsize=(12, 5))
+
+    # Plot Accuracy
+    ax_acc.plot(history.history['accuracy'], label='Train Accuracy', marker='o')
+    ax_acc.plot(history.history['val_accuracy'], label='Validation Accuracy', marker='o')
+    ax_acc.set_title('Model Accuracy Over Epochs')
+    ax_acc.set_xlabel('Epoch')
+    ax_acc.set_ylabel('Accuracy')
+    ax_acc.legend()
+
+    # Plot Loss
+    ax_loss.plot(history.history['loss'], label='Train Loss', marker='o')
+    ax_loss.plot(history.history['val_loss'], label='Validation Loss', marker='o')
+    ax_loss.set_title('Model Loss Over Epochs')
+    ax_loss.set_xlabel('Epoch')
+    ax_loss.set_ylabel('Loss')
+    ax_loss.legend()
+
+    fig.tight_layout()
+    st.pyplot(fig)
+    plt.close(fig)
 
 """### Prediction"""
 
-# Predict probabilities
-y_pred_prob = model.predict(X_test)
-
-# Convert to binary labels (0 or 1)
-y_pred = (y_pred_prob > 0.5).astype(int)
-
+# y_pred_prob and y_pred (0 or 1) come from the inference pass after training
 print("Test set Accuracy:", accuracy_score(y_test, y_pred))
 
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
-
-print("Test set Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
+cm = confusion_matrix(y_test, y_pred)
+print("Test set Confusion Matrix:\n", cm)
 print("Classification Report:\n", classification_report(y_test, y_pred))
 
-decoded_df = pd.DataFrame(X_test, columns=['Year', 'Month', 'State', 'Location', 'Food'])
+# Map the category codes back to their labels
+decoded_df = pd.DataFrame(X_test.astype(np.int64), columns=features)
+for col, categories in cat_dict.items():
+    decoded_df[col] = categories[decoded_df[col].to_numpy()]
 
 # Add Actual and Predicted columns
-decoded_df['Actual'] = y_test.values
-decoded_df['Predicted'] = y_pred.flatten()
-
-# Final DataFrame
-final_df = decoded_df.copy()
+decoded_df[['Actual', 'Predicted']] = np.column_stack([y_test, y_pred])
 
 # View top results
-final_df.head(10)          # Actual = 1, Predicted = 0 means a false negative,
+decoded_df.head(10)        # Actual = 1, Predicted = 0 means a false negative,
                            # Actual = 0, Predicted = 1 means a false positive.
 
 # View Only Incorrect Predictions
-incorrect_preds = final_df[final_df['Actual'] != final_df['Predicted']]
+mask = y_test != y_pred
+incorrect_preds = decoded_df[mask]
 incorrect_preds.head(10)
 
 """### Confusion Matrix Visualization"""
 
-cm = confusion_matrix(y_test, y_pred)
-
-sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
-            xticklabels=['No Hospitalization', 'Hospitalization'],
-            yticklabels=['No Hospitalization', 'Hospitalization'])
-plt.xlabel('Predicted')
-plt.ylabel('Actual')
-plt.title('Confusion Matrix')
-plt.show()
+if st.checkbox("Show confusion matrix"):
+    fig, ax = plt.subplots()
+    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
+                xticklabels=['No Hospitalization', 'Hospitalization'],
+                yticklabels=['No Hospitalization', 'Hospitalization'], ax=ax)
+    ax.set_xlabel('Predicted')
+    ax.set_ylabel('Actual')
+    ax.set_title('Confusion Matrix')
+    st.pyplot(fig)
+    plt.close(fig)